@@ -1,12 +1,26 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
+import pydeck as pdk
+import os
+import contextlib
+import re
+import time
+import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import orjson
+import pyarrow as pa
+import pyarrow.parquet as pq
 import requests
+from requests.adapters import HTTPAdapter
 from datetime import datetime
 import pytz
 import folium
-from folium.plugins import MarkerCluster
+from folium.plugins import FastMarkerCluster
 from streamlit_folium import st_folium
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 # -----------------------------------------------
 # Region keywords for filtering
@@ -21,30 +35,191 @@ REGION_KEYWORDS = {
     "Pacific Ocean": ["Pacific", "Tonga", "Vanuatu", "Kermadec", "Solomon", "Guam"]
 }
 
+# Regex for "contains any of these words" with shared prefixes factored out
+# (e.g. "Pa(?:cific|kistan|pua)"), so the matcher walks a trie instead of
+# retrying every keyword at each position
+def keyword_trie_pattern(words):
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word.lower():
+            node = node.setdefault(char, {})
+        node[""] = {}
+    return trie_node_pattern(trie)
+
+def trie_node_pattern(node):
+    # A word ending here already satisfies a substring match, so longer words
+    # sharing this prefix add nothing
+    if "" in node:
+        return ""
+    branches = [re.escape(char) + trie_node_pattern(child) for char, child in sorted(node.items())]
+    return branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+
+# Single compiled regex matching places that satisfy both the region selection
+# and the search keyword (one lookahead each), reused across reruns
+@st.cache_resource(max_entries=64)
+def get_place_pattern(regions, keyword):
+    lookaheads = []
+    if regions:
+        keywords = [term for region in regions for term in REGION_KEYWORDS[region]]
+        lookaheads.append("(?=.*" + keyword_trie_pattern(keywords) + ")")
+    if keyword:
+        lookaheads.append("(?=.*" + re.escape(keyword) + ")")
+    return re.compile("^" + "".join(lookaheads), re.IGNORECASE)
+
+# -----------------------------------------------
+# Shared HTTP session (keep-alive + gzip-compressed USGS responses)
+@st.cache_resource
+def get_http_session():
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=2, pool_maxsize=4))
+    session.headers.update({"Accept-Encoding": "gzip"})
+    return session
+
+# Last ETag/Last-Modified and parsed DataFrame per feed URL, for conditional GETs
+@st.cache_resource
+def get_feed_cache():
+    return {}
+
+# -----------------------------------------------
+# Parse GeoJSON features into a DataFrame
+EARTHQUAKE_COLUMNS = ["place", "magnitude", "time_utc", "time_local", "latitude", "longitude", "marker_size"]
+
+def parse_features(features):
+    if not features:
+        return pd.DataFrame(columns=EARTHQUAKE_COLUMNS)
+
+    df = pd.json_normalize(features)
+    df = df.rename(columns={
+        "properties.place": "place",
+        "properties.mag": "magnitude",
+        "properties.time": "t"
+    })
+    # Rounded once to ~10 m: ample for display, and pydeck/folium emit short JSON numbers
+    coords = np.asarray(df["geometry.coordinates"].tolist(), dtype=np.float64).round(4)
+    df["longitude"] = coords[:, 0]
+    df["latitude"] = coords[:, 1]
+    df["time_utc"] = pd.to_datetime(df["t"], unit='ms', utc=True)
+    df["time_local"] = df["time_utc"].dt.tz_convert(pytz.timezone('America/Los_Angeles'))
+    # Relative marker size (magnitude * 4, floored at 2) for Plotly, which still
+    # scales it by sizeref; uint16 only shrinks the typed array sent to the browser
+    df["marker_size"] = np.rint(np.clip(df["magnitude"].fillna(0).to_numpy() * 4, 2, 40)).astype(np.uint16)
+
+    return df[EARTHQUAKE_COLUMNS]
+
+# -----------------------------------------------
+# On-disk parquet copy of each parsed feed, shared across process restarts
+# and app instances on the same host. The conditional-GET validators travel
+# in the parquet schema metadata so a restarted process can seed its cache.
+FEED_TTL_SECONDS = 60
+FEED_METADATA_KEY = b"usgs_feed"
+
+# Cached frames end up in popups as HTML, so the files live in a directory only
+# this user can write; the disk cache is skipped if that cannot be guaranteed
+def feed_cache_dir():
+    suffix = f"-{os.getuid()}" if hasattr(os, "getuid") else ""
+    path = os.path.join(tempfile.gettempdir(), f"earthquake-app-cache{suffix}")
+    try:
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        info = os.stat(path)
+    except OSError:
+        return None
+    if hasattr(os, "getuid") and (info.st_uid != os.getuid() or info.st_mode & 0o077):
+        return None
+    return path
+
+def feed_cache_path(url):
+    cache_dir = feed_cache_dir()
+    if cache_dir is None:
+        return None
+    digest = hashlib.sha1(url.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cache_dir, f"usgs_{digest}.parquet")
+
+def cached_feed_age(url):
+    path = feed_cache_path(url)
+    if path is None:
+        return None
+    try:
+        return time.time() - os.path.getmtime(path)
+    except OSError:
+        return None
+
+def read_cached_feed(url):
+    try:
+        table = pq.read_table(feed_cache_path(url))
+    except OSError:
+        return None
+    entry = orjson.loads((table.schema.metadata or {}).get(FEED_METADATA_KEY, b"{}"))
+    entry["data"] = table.to_pandas()
+    return entry
+
+def write_cached_feed(url, entry):
+    path = feed_cache_path(url)
+    if path is None:
+        return
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    table = pa.Table.from_pandas(entry["data"], preserve_index=False)
+    feed_metadata = {key: value for key, value in entry.items() if key != "data"}
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), FEED_METADATA_KEY: orjson.dumps(feed_metadata)})
+    try:
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, path)
+    except OSError:
+        # A read-only or full temp dir only costs the disk cache, not the fetch
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+
+def touch_cached_feed(url, entry):
+    # An unchanged feed (304) keeps the disk copy fresh for other processes
+    path = feed_cache_path(url)
+    if path is None:
+        return
+    try:
+        os.utime(path)
+    except OSError:
+        write_cached_feed(url, entry)
+
 # -----------------------------------------------
 # Fetch Earthquake Data
+# USGS caches feed responses for 60 seconds, so refetching sooner gains nothing.
+# An unchanged feed answers the conditional GET with 304 and skips the parse.
+@st.cache_data(ttl=FEED_TTL_SECONDS, show_spinner=False)
 def fetch_earthquake_data(url):
-    response = requests.get(url)
-    data = response.json()
-    features = data['features']
-    earthquakes = []
-
-    for feature in features:
-        properties = feature['properties']
-        geometry = feature['geometry']
-        utc_time = pd.to_datetime(properties['time'], unit='ms')
-        local_time = utc_time.tz_localize('UTC').tz_convert(pytz.timezone('America/Los_Angeles'))
-
-        earthquakes.append({
-            "place": properties['place'],
-            "magnitude": properties['mag'],
-            "time_utc": utc_time,
-            "time_local": local_time,
-            "latitude": geometry['coordinates'][1],
-            "longitude": geometry['coordinates'][0]
-        })
-
-    return pd.DataFrame(earthquakes)
+    feed_cache = get_feed_cache()
+    cached = feed_cache.get(url)
+
+    # A fresh disk copy is served as-is; a stale one still seeds the validators
+    # after a restart, so the GET below can come back 304 and reuse its frame
+    disk_age = cached_feed_age(url)
+    if disk_age is not None and (disk_age < FEED_TTL_SECONDS or cached is None):
+        disk_entry = read_cached_feed(url)
+        if disk_entry is not None:
+            feed_cache[url] = cached = disk_entry
+            if disk_age < FEED_TTL_SECONDS:
+                return disk_entry["data"]
+
+    headers = {}
+    if cached:
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+    response = get_http_session().get(url, headers=headers, timeout=10)
+    if response.status_code == 304 and cached:
+        touch_cached_feed(url, cached)
+        return cached["data"]
+    response.raise_for_status()
+
+    data = orjson.loads(response.content)
+    entry = {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "data": parse_features(data['features'])
+    }
+    feed_cache[url] = entry
+    write_cached_feed(url, entry)
+    return entry["data"]
 
 # -----------------------------------------------
 # Sidebar controls
@@ -61,129 +236,182 @@ st.markdown("Live data from [USGS Earthquake API](https://earthquake.usgs.gov/)
 realtime_url = "https://earthquake.usgs.gov/earthquakes/feed/v1.0/summary/all_hour.geojson"
 historical_url = "https://earthquake.usgs.gov/earthquakes/feed/v1.0/summary/all_month.geojson"
 
-realtime_data = fetch_earthquake_data(realtime_url)
-historical_data = fetch_earthquake_data(historical_url)
-
-# -----------------------------------------------
-# Apply magnitude filter
-realtime_data = realtime_data[realtime_data["magnitude"] >= min_magnitude]
-historical_data = historical_data[historical_data["magnitude"] >= min_magnitude]
+# Fetch both feeds concurrently so a cold start waits on one round trip, not two.
+# Worker threads get this run's context so the cached fetch works off the main thread.
+with ThreadPoolExecutor(max_workers=2, initializer=add_script_run_ctx, initargs=(None, get_script_run_ctx())) as executor:
+    realtime_future = executor.submit(fetch_earthquake_data, realtime_url)
+    historical_future = executor.submit(fetch_earthquake_data, historical_url)
+    realtime_data, historical_data = realtime_future.result(), historical_future.result()
 
 # -----------------------------------------------
-# Apply region filter
-def apply_region_filter(df):
-    if not selected_regions:
-        return df
-    keywords = [term for region in selected_regions for term in REGION_KEYWORDS[region]]
-    return df[df["place"].str.contains("|".join(keywords), case=False, na=False)]
+# Apply magnitude, region and keyword filters as one combined mask
+def apply_filters(df):
+    mask = df["magnitude"].to_numpy() >= min_magnitude
+    if selected_regions or location_keyword:
+        pattern = get_place_pattern(tuple(sorted(selected_regions)), location_keyword)
+        mask &= df["place"].str.contains(pattern, regex=True, na=False).to_numpy()
+    return df[mask]
 
-realtime_data = apply_region_filter(realtime_data)
-historical_data = apply_region_filter(historical_data)
+realtime_data = apply_filters(realtime_data)
+historical_data = apply_filters(historical_data)
 
 # -----------------------------------------------
-# Apply keyword search
-if location_keyword:
-    realtime_data = realtime_data[realtime_data["place"].str.contains(location_keyword, case=False, na=False)]
-    historical_data = historical_data[historical_data["place"].str.contains(location_keyword, case=False, na=False)]
+# Scatter map figure shared by the real-time map and the time-lapse. Cached as a
+# resource keyed on the DataFrame contents so reruns with unchanged filters reuse
+# the same figure object without re-validation; callers must not mutate it.
+@st.cache_resource(max_entries=32, show_spinner=False)
+def make_quake_map(df, hover_data, height=600, margin=None, **kwargs):
+    fig = px.scatter_mapbox(
+        df,
+        lat="latitude",
+        lon="longitude",
+        size="marker_size",
+        color="magnitude",
+        hover_name="place",
+        hover_data=hover_data,
+        zoom=1,
+        height=height,
+        **kwargs
+    )
+    fig.update_layout(mapbox_style="open-street-map")
+    if margin is not None:
+        fig.update_layout(margin=margin)
+    return fig
 
 # -----------------------------------------------
 # Real-time Earthquake Map
 st.subheader("📍 Real-Time Earthquakes (Past Hour)")
-fig_realtime = px.scatter_mapbox(
-    realtime_data,
-    lat="latitude",
-    lon="longitude",
-    size="magnitude",
-    color="magnitude",
-    hover_name="place",
-    hover_data={"time_utc": True, "time_local": True},
-    zoom=1,
-    height=600
-)
-fig_realtime.update_layout(mapbox_style="open-street-map")
+fig_realtime = make_quake_map(realtime_data, hover_data={"time_utc": True, "time_local": True, "marker_size": False})
 st.plotly_chart(fig_realtime)
 
 # -----------------------------------------------
-# Historical Earthquake Map
+# Historical Earthquake Map and Heatmap (deck.gl, rendered on the GPU)
+# Only the columns the layers read are shipped to the browser
+WORLD_VIEW = pdk.ViewState(latitude=0, longitude=0, zoom=1)
+# Plotly's default continuous scale, so deck.gl markers colour like the Plotly maps
+MAGNITUDE_COLORSCALE = np.array([
+    [int(color[i:i + 2], 16) for i in (1, 3, 5)] for color in px.colors.sequential.Plasma
+])
+
+def magnitude_fill_colors(magnitude):
+    # RGBA per event, scaled over the frame's magnitude range like Plotly's colour axis
+    values = magnitude.to_numpy(dtype=np.float64)
+    low, high = values.min(), values.max()
+    position = (values - low) / (high - low) if high > low else np.zeros_like(values)
+    steps = np.arange(len(MAGNITUDE_COLORSCALE))
+    rgb = [np.interp(position * steps[-1], steps, MAGNITUDE_COLORSCALE[:, channel]) for channel in range(3)]
+    return np.rint(np.column_stack(rgb + [np.full(values.size, 180)])).astype(np.uint8).tolist()
+
+def deck_points(df):
+    points = df[["longitude", "latitude", "magnitude", "place"]].copy()
+    if df.empty:
+        return points
+    points["time_utc"] = df["time_utc"].dt.strftime("%Y-%m-%d %H:%M:%S UTC")
+    points["time_local"] = df["time_local"].dt.strftime("%Y-%m-%d %H:%M:%S %Z")
+    points["fill_color"] = magnitude_fill_colors(df["magnitude"])
+    return points
+
+historical_points = deck_points(historical_data)
+
 st.subheader("📌 Historical Earthquakes (Past Month)")
-fig_historical = px.scatter_mapbox(
-    historical_data,
-    lat="latitude",
-    lon="longitude",
-    size="magnitude",
-    color="magnitude",
-    hover_name="place",
-    hover_data={"time_utc": True, "time_local": True},
-    zoom=1,
-    height=600
-)
-fig_historical.update_layout(mapbox_style="open-street-map")
-st.plotly_chart(fig_historical)
+if not historical_data.empty:
+    st.pydeck_chart(pdk.Deck(
+        layers=[pdk.Layer(
+            "ScatterplotLayer",
+            data=historical_points,
+            get_position="[longitude, latitude]",
+            get_radius="magnitude * 10000",
+            radius_min_pixels=2,
+            get_fill_color="fill_color",
+            pickable=True
+        )],
+        initial_view_state=WORLD_VIEW,
+        tooltip={"html": "<b>{place}</b><br>Mag: {magnitude}<br>{time_utc}<br>{time_local}"}
+    ))
+else:
+    st.info("No data available for historical map.")
 
-# -----------------------------------------------
-# Heatmap
 st.subheader("🔥 Earthquake Density Heatmap")
 if not historical_data.empty:
-    fig_heatmap = px.density_mapbox(
-        historical_data,
-        lat="latitude",
-        lon="longitude",
-        z="magnitude",
-        radius=10,
-        center={"lat": 0, "lon": 0},
-        zoom=1,
-        mapbox_style="open-street-map",
-        height=600
-    )
-    st.plotly_chart(fig_heatmap, use_container_width=True)
+    st.pydeck_chart(pdk.Deck(
+        layers=[pdk.Layer(
+            "HeatmapLayer",
+            data=historical_points,
+            get_position="[longitude, latitude]",
+            get_weight="magnitude",
+            radius_pixels=30
+        )],
+        initial_view_state=WORLD_VIEW
+    ))
 else:
     st.info("No data available for heatmap.")
 
 # -----------------------------------------------
 # Clustering Map (Folium)
+# Markers are built in the browser from [lat, lon, popup] rows
+MARKER_POPUP_CALLBACK = """
+function (row) {
+    var marker = L.marker(new L.LatLng(row[0], row[1]));
+    marker.bindPopup(row[2]);
+    return marker;
+};
+"""
+
 st.subheader("🧭 Earthquake Clustering Map")
 if not historical_data.empty:
     m = folium.Map(location=[0, 0], zoom_start=2)
-    cluster = MarkerCluster().add_to(m)
-    for _, row in historical_data.iterrows():
-        folium.Marker(
-            location=[row["latitude"], row["longitude"]],
-            popup=f"<b>{row['place']}</b><br>Mag: {row['magnitude']}<br>{row['time_local']}"
-        ).add_to(cluster)
+    popups = (
+        "<b>" + historical_data["place"].fillna("").astype(str) + "</b><br>Mag: "
+        + historical_data["magnitude"].astype(str) + "<br>" + historical_data["time_local"].astype(str)
+    )
+    locations = historical_data[["latitude", "longitude"]].assign(popup=popups).to_numpy().tolist()
+    FastMarkerCluster(locations, callback=MARKER_POPUP_CALLBACK).add_to(m)
     st_folium(m, width=1200, height=600)
 else:
     st.info("No data available for clustering map.")
 
 # -----------------------------------------------
 # Time-lapse Animation
+TIME_LAPSE_FRAME_DAYS = 3
+
 st.subheader("📽️ Earthquake Time-Lapse Animation")
 if not historical_data.empty:
-    historical_data["date"] = historical_data["time_local"].dt.date.astype(str)
-    fig_animation = px.scatter_mapbox(
+    # Group events into multi-day frames (labelled by their first day) to keep
+    # the number of animation frames around ten for the monthly feed
+    days = historical_data["time_local"].dt.tz_localize(None).to_numpy().astype("datetime64[D]").astype(np.int64)
+    frame_start = (days - days % TIME_LAPSE_FRAME_DAYS).astype("datetime64[D]")
+    dates = pd.Series(np.datetime_as_string(frame_start, unit="D"), index=historical_data.index, name="date")
+    fig_animation = make_quake_map(
         historical_data,
-        lat="latitude",
-        lon="longitude",
-        size="magnitude",
-        color="magnitude",
-        hover_name="place",
-        hover_data={"time_local": True, "magnitude": True},
-        animation_frame="date",
-        zoom=1,
-        height=700
+        hover_data={"time_local": True, "magnitude": True, "marker_size": False},
+        height=700,
+        margin={"r":0, "t":40, "l":0, "b":0},
+        animation_frame=dates,
+        # Feeds list newest events first; play frames in chronological order
+        category_orders={"date": sorted(dates.unique())}
     )
-    fig_animation.update_layout(mapbox_style="open-street-map")
-    fig_animation.update_layout(margin={"r":0, "t":40, "l":0, "b":0})
     st.plotly_chart(fig_animation)
 else:
     st.info("No data available for animation.")
 
 # -----------------------------------------------
 # Data Tables
+# Only the first rows are sent to the browser unless the full table is requested
+TABLE_PREVIEW_ROWS = 200
+
+def show_table(df, key):
+    # marker_size is a rendering detail for the maps, not data for the reader
+    df = df.drop(columns="marker_size")
+    if st.checkbox("Show full table", key=key):
+        st.dataframe(df)
+    else:
+        st.dataframe(df.head(TABLE_PREVIEW_ROWS))
+
 st.subheader("📋 Filtered Real-Time Earthquake Data")
-st.write(realtime_data)
+show_table(realtime_data, key="full_realtime_table")
 
 st.subheader("📋 Filtered Historical Earthquake Data")
-st.write(historical_data)
+show_table(historical_data, key="full_historical_table")
 
 # -----------------------------------------------
 # Sidebar Info